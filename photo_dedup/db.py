@@ -9,13 +9,56 @@ import sqlite3
 import logging
 import os
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, Optional, Set, Tuple, Any, Iterator
 from contextlib import contextmanager
 
 logger = logging.getLogger("photo_dedup")
 
 DB_NAME = "photo_dedup.db"
 
+# Insert statements shared by the single-row and batch methods; a file
+# that is indexed again (it changed since the last scan) replaces its row
+_INSERT_PHOTO_SQL = """
+    INSERT INTO photos(
+        path, folder, size, hash, date_taken, camera_model,
+        gps_lat, gps_lon, orientation, width, height, mtime_ns
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(path) DO UPDATE SET
+        size = excluded.size, hash = excluded.hash, mtime_ns = excluded.mtime_ns,
+        date_taken = excluded.date_taken, camera_model = excluded.camera_model,
+        gps_lat = excluded.gps_lat, gps_lon = excluded.gps_lon,
+        orientation = excluded.orientation, width = excluded.width,
+        height = excluded.height, updated_at = CURRENT_TIMESTAMP
+"""
+
+_INSERT_VIDEO_SQL = """
+    INSERT INTO videos(
+        path, folder, size, hash, duration, width, height, mtime_ns
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(path) DO UPDATE SET
+        size = excluded.size, hash = excluded.hash, mtime_ns = excluded.mtime_ns,
+        duration = excluded.duration, width = excluded.width,
+        height = excluded.height, updated_at = CURRENT_TIMESTAMP
+"""
+
+# Bytes of the database file SQLite may memory-map
+MMAP_SIZE = 256 * 1024 * 1024
+
+# WAL size in pages (about 40 MB) at which SQLite checkpoints it into the
+# database file; each checkpoint syncs, so a scan should rarely trigger one
+WAL_AUTOCHECKPOINT_PAGES = 10000
+
+# Prefix of the placeholder hash stored for files whose size no other file
+# shares (such files cannot have a duplicate, so they are not hashed)
+SIZE_HASH_PREFIX = "size:"
+# Exclusive upper bound of placeholder hashes, for range queries on the hash index
+_SIZE_HASH_END = SIZE_HASH_PREFIX[:-1] + chr(ord(SIZE_HASH_PREFIX[-1]) + 1)
+# Placeholder prefixes per table: folder comparisons mix photo and video
+# hashes, where a bare size would make a photo and a video of the same
+# size look like the same file
+PHOTO_SIZE_HASH_PREFIX = SIZE_HASH_PREFIX + "photo:"
+VIDEO_SIZE_HASH_PREFIX = SIZE_HASH_PREFIX + "video:"
+
 
 class DatabaseError(Exception):
     """Base exception for database errors."""
@@ -61,8 +104,14 @@ class Database:
             self.conn.row_factory = sqlite3.Row
             # Enable WAL mode for better concurrent access
             self.conn.execute("PRAGMA journal_mode=WAL")
+            # In WAL mode NORMAL only syncs at checkpoints, and a crash can
+            # lose at most the last batches, never corrupt the database
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(f"PRAGMA wal_autocheckpoint={WAL_AUTOCHECKPOINT_PAGES}")
             # Enable foreign keys
             self.conn.execute("PRAGMA foreign_keys=ON")
+            # Memory-map the database file so index lookups skip read() calls
+            self.conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
         except sqlite3.Error as e:
             raise DatabaseError(f"Failed to connect to database: {e}") from e
     
@@ -84,6 +133,7 @@ class Database:
                     orientation INTEGER,
                     width INTEGER,
                     height INTEGER,
+                    mtime_ns INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
@@ -100,11 +150,25 @@ class Database:
                     duration REAL,
                     width INTEGER,
                     height INTEGER,
+                    mtime_ns INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
             """)
             
+            # Content hashes by file identity, so moved or renamed files
+            # can be indexed again without reading them
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS file_sig (
+                    dev INTEGER NOT NULL,
+                    ino INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    hash TEXT NOT NULL,
+                    PRIMARY KEY (dev, ino)
+                ) WITHOUT ROWID;
+            """)
+            
             # Metadata table for storing database info
             self.conn.execute("""
                 CREATE TABLE IF NOT EXISTS metadata (
@@ -114,6 +178,12 @@ class Database:
                 );
             """)
             
+            # Databases created before files had their mtime recorded
+            for table in ("photos", "videos"):
+                columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+                if "mtime_ns" not in columns:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN mtime_ns INTEGER")
+            
             self.conn.commit()
             logger.debug("Database schema initialized")
             
@@ -156,29 +226,26 @@ class Database:
     # Insert Operations
     # ---------------------------
     
-    def insert_photo(self, path: str, size: int, hash_value: str, exif: Optional[Dict[str, Any]] = None) -> bool:
+    def insert_photo(self, path: str, size: int, hash_value: str, exif: Optional[Dict[str, Any]] = None,
+                     mtime_ns: Optional[int] = None) -> bool:
         """
-        Insert a single photo record.
+        Insert a single photo record, or update the record of its path.
         
         Args:
             path: Full path to photo file
             size: File size in bytes
             hash_value: Hash of file content
             exif: Optional EXIF metadata dictionary
+            mtime_ns: Optional modification time of the hashed content
             
         Returns:
-            True if inserted, False if already exists
+            True if the record was inserted or updated, False on error
         """
         exif = exif or {}
-        folder = str(Path(path).parent)
+        folder = os.path.dirname(path)
         
         try:
-            self.conn.execute("""
-                INSERT OR IGNORE INTO photos(
-                    path, folder, size, hash, date_taken, camera_model, 
-                    gps_lat, gps_lon, orientation, width, height
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            cursor = self.conn.execute(_INSERT_PHOTO_SQL, (
                 path,
                 folder,
                 size,
@@ -189,9 +256,10 @@ class Database:
                 exif.get("gps_lon"),
                 exif.get("orientation"),
                 exif.get("width"),
-                exif.get("height")
+                exif.get("height"),
+                mtime_ns
             ))
-            return self.conn.total_changes > 0
+            return cursor.rowcount > 0
             
         except sqlite3.Error as e:
             logger.error(f"Failed to insert photo {path}: {e}")
@@ -199,10 +267,11 @@ class Database:
     
     def insert_photos_batch(self, batch: List[Tuple]) -> int:
         """
-        Insert multiple photo records in a batch.
+        Insert multiple photo records in a batch and commit them.
         
         Args:
-            batch: List of tuples (path, size, hash, exif_dict)
+            batch: List of tuples (path, size, hash, exif_dict) or
+                   (path, size, hash, exif_dict, mtime_ns)
             
         Returns:
             Number of records inserted
@@ -214,7 +283,8 @@ class Database:
         for item in batch:
             path, size, hash_value = item[:3]
             exif = item[3] if len(item) > 3 else {}
-            folder = str(Path(path).parent)
+            mtime_ns = item[4] if len(item) > 4 else None
+            folder = os.path.dirname(path)
             
             data.append((
                 path, folder, size, hash_value,
@@ -224,16 +294,14 @@ class Database:
                 exif.get("gps_lon"),
                 exif.get("orientation"),
                 exif.get("width"),
-                exif.get("height")
+                exif.get("height"),
+                mtime_ns
             ))
         
         try:
-            cursor = self.conn.executemany("""
-                INSERT OR IGNORE INTO photos(
-                    path, folder, size, hash, date_taken, camera_model,
-                    gps_lat, gps_lon, orientation, width, height
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, data)
+            # The connection context commits the whole batch in one transaction
+            with self.conn:
+                cursor = self.conn.executemany(_INSERT_PHOTO_SQL, data)
             
             return cursor.rowcount
             
@@ -241,37 +309,36 @@ class Database:
             logger.error(f"Failed to insert photo batch: {e}")
             return 0
     
-    def insert_video(self, path: str, size: int, hash_value: str, metadata: Optional[Dict[str, Any]] = None) -> bool:
+    def insert_video(self, path: str, size: int, hash_value: str, metadata: Optional[Dict[str, Any]] = None,
+                     mtime_ns: Optional[int] = None) -> bool:
         """
-        Insert a single video record.
+        Insert a single video record, or update the record of its path.
         
         Args:
             path: Full path to video file
             size: File size in bytes
             hash_value: Hash of file content
             metadata: Optional video metadata dictionary
+            mtime_ns: Optional modification time of the hashed content
             
         Returns:
-            True if inserted, False if already exists
+            True if the record was inserted or updated, False on error
         """
         metadata = metadata or {}
-        folder = str(Path(path).parent)
+        folder = os.path.dirname(path)
         
         try:
-            self.conn.execute("""
-                INSERT OR IGNORE INTO videos(
-                    path, folder, size, hash, duration, width, height
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
+            cursor = self.conn.execute(_INSERT_VIDEO_SQL, (
                 path,
                 folder,
                 size,
                 hash_value,
                 metadata.get("duration"),
                 metadata.get("width"),
-                metadata.get("height")
+                metadata.get("height"),
+                mtime_ns
             ))
-            return self.conn.total_changes > 0
+            return cursor.rowcount > 0
             
         except sqlite3.Error as e:
             logger.error(f"Failed to insert video {path}: {e}")
@@ -279,10 +346,12 @@ class Database:
     
     def insert_videos_batch(self, batch: List[Tuple]) -> int:
         """
-        Insert multiple video records in a batch.
+        Insert multiple video records in a batch and commit them.
         
         Args:
-            batch: List of tuples (path, size, hash) or (path, size, hash, metadata_dict)
+            batch: List of tuples (path, size, hash), (path, size, hash, metadata_dict)
+                   or (path, size, hash, metadata_dict, mtime_ns); metadata_dict
+                   may be None
             
         Returns:
             Number of records inserted
@@ -293,22 +362,21 @@ class Database:
         data = []
         for item in batch:
             path, size, hash_value = item[:3]
-            metadata = item[3] if len(item) > 3 else {}
-            folder = str(Path(path).parent)
+            metadata = (item[3] if len(item) > 3 else None) or {}
+            mtime_ns = item[4] if len(item) > 4 else None
+            folder = os.path.dirname(path)
             
             data.append((
                 path, folder, size, hash_value,
                 metadata.get("duration"),
                 metadata.get("width"),
-                metadata.get("height")
+                metadata.get("height"),
+                mtime_ns
             ))
         
         try:
-            cursor = self.conn.executemany("""
-                INSERT OR IGNORE INTO videos(
-                    path, folder, size, hash, duration, width, height
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, data)
+            with self.conn:
+                cursor = self.conn.executemany(_INSERT_VIDEO_SQL, data)
             
             return cursor.rowcount
             
@@ -316,6 +384,106 @@ class Database:
             logger.error(f"Failed to insert video batch: {e}")
             return 0
     
+    def update_photo_hashes(self, batch: List[Tuple]) -> int:
+        """
+        Replace the hash of existing photo records and commit the change.
+        
+        Args:
+            batch: List of tuples (path, size, hash, ...) as produced by the scanner
+            
+        Returns:
+            Number of records updated
+        """
+        if not batch:
+            return 0
+        
+        try:
+            with self.conn:
+                cursor = self.conn.executemany(
+                    "UPDATE photos SET hash = ? WHERE path = ?",
+                    [(item[2], item[0]) for item in batch]
+                )
+            return cursor.rowcount
+            
+        except sqlite3.Error as e:
+            logger.error(f"Failed to update photo hashes: {e}")
+            return 0
+    
+    def update_video_hashes(self, batch: List[Tuple]) -> int:
+        """
+        Replace the hash of existing video records and commit the change.
+        
+        Args:
+            batch: List of tuples (path, size, hash, ...) as produced by the scanner
+            
+        Returns:
+            Number of records updated
+        """
+        if not batch:
+            return 0
+        
+        try:
+            with self.conn:
+                cursor = self.conn.executemany(
+                    "UPDATE videos SET hash = ? WHERE path = ?",
+                    [(item[2], item[0]) for item in batch]
+                )
+            return cursor.rowcount
+            
+        except sqlite3.Error as e:
+            logger.error(f"Failed to update video hashes: {e}")
+            return 0
+    
+    def update_photo_mtimes(self, batch: List[Tuple]) -> int:
+        """
+        Record the modification time of existing photo records and commit.
+        
+        Args:
+            batch: List of tuples (path, mtime_ns)
+            
+        Returns:
+            Number of records updated
+        """
+        if not batch:
+            return 0
+        
+        try:
+            with self.conn:
+                cursor = self.conn.executemany(
+                    "UPDATE photos SET mtime_ns = ? WHERE path = ?",
+                    [(mtime_ns, path) for path, mtime_ns in batch]
+                )
+            return cursor.rowcount
+            
+        except sqlite3.Error as e:
+            logger.error(f"Failed to update photo mtimes: {e}")
+            return 0
+    
+    def update_video_mtimes(self, batch: List[Tuple]) -> int:
+        """
+        Record the modification time of existing video records and commit.
+        
+        Args:
+            batch: List of tuples (path, mtime_ns)
+            
+        Returns:
+            Number of records updated
+        """
+        if not batch:
+            return 0
+        
+        try:
+            with self.conn:
+                cursor = self.conn.executemany(
+                    "UPDATE videos SET mtime_ns = ? WHERE path = ?",
+                    [(mtime_ns, path) for path, mtime_ns in batch]
+                )
+            return cursor.rowcount
+            
+        except sqlite3.Error as e:
+            logger.error(f"Failed to update video mtimes: {e}")
+            return 0
+    
     def commit(self):
         """Commit pending transactions."""
         try:
@@ -348,6 +516,108 @@ class Database:
         """Get all photo and video records combined."""
         return list(self.list_all_photos()) + list(self.list_all_videos())
     
+    def list_all_photo_paths(self) -> Iterator[str]:
+        """Iterate over the paths of all photo records (path column only)."""
+        try:
+            return (row[0] for row in self.conn.execute("SELECT path FROM photos"))
+        except sqlite3.Error as e:
+            logger.error(f"Failed to list photo paths: {e}")
+            return iter(())
+    
+    def list_all_video_paths(self) -> Iterator[str]:
+        """Iterate over the paths of all video records (path column only)."""
+        try:
+            return (row[0] for row in self.conn.execute("SELECT path FROM videos"))
+        except sqlite3.Error as e:
+            logger.error(f"Failed to list video paths: {e}")
+            return iter(())
+    
+    def list_photo_sizes(self) -> Set[int]:
+        """Get the distinct sizes of all photo records."""
+        try:
+            return {row[0] for row in self.conn.execute("SELECT DISTINCT size FROM photos")}
+        except sqlite3.Error as e:
+            logger.error(f"Failed to list photo sizes: {e}")
+            return set()
+    
+    def list_video_sizes(self) -> Set[int]:
+        """Get the distinct sizes of all video records."""
+        try:
+            return {row[0] for row in self.conn.execute("SELECT DISTINCT size FROM videos")}
+        except sqlite3.Error as e:
+            logger.error(f"Failed to list video sizes: {e}")
+            return set()
+    
+    def list_size_only_photos(self) -> Dict[int, str]:
+        """
+        Get the photo records that still hold a size placeholder hash.
+        
+        Returns:
+            Dictionary mapping size -> path
+        """
+        try:
+            rows = self.conn.execute(
+                "SELECT size, path FROM photos WHERE hash >= ? AND hash < ?",
+                (SIZE_HASH_PREFIX, _SIZE_HASH_END)
+            )
+            return {row[0]: row[1] for row in rows}
+        except sqlite3.Error as e:
+            logger.error(f"Failed to list size-only photos: {e}")
+            return {}
+    
+    def list_size_only_videos(self) -> Dict[int, str]:
+        """
+        Get the video records that still hold a size placeholder hash.
+        
+        Returns:
+            Dictionary mapping size -> path
+        """
+        try:
+            rows = self.conn.execute(
+                "SELECT size, path FROM videos WHERE hash >= ? AND hash < ?",
+                (SIZE_HASH_PREFIX, _SIZE_HASH_END)
+            )
+            return {row[0]: row[1] for row in rows}
+        except sqlite3.Error as e:
+            logger.error(f"Failed to list size-only videos: {e}")
+            return {}
+    
+    def is_path_indexed(self, path: str) -> bool:
+        """Check whether a photo or video record exists for a file path."""
+        try:
+            row = self.conn.execute("""
+                SELECT 1 FROM photos WHERE path = ?
+                UNION ALL
+                SELECT 1 FROM videos WHERE path = ?
+                LIMIT 1
+            """, (path, path)).fetchone()
+            return row is not None
+        except sqlite3.Error as e:
+            logger.error(f"Failed to look up path {path}: {e}")
+            return False
+    
+    def get_indexed_stat(self, path: str) -> Optional[Tuple[int, Optional[int]]]:
+        """
+        Get the size and modification time recorded for an indexed file path.
+        
+        Args:
+            path: File path
+            
+        Returns:
+            Tuple of (size, mtime_ns), mtime_ns being None for records made
+            before it was stored, or None if the path is not indexed
+        """
+        try:
+            return self.conn.execute("""
+                SELECT size, mtime_ns FROM photos WHERE path = ?
+                UNION ALL
+                SELECT size, mtime_ns FROM videos WHERE path = ?
+                LIMIT 1
+            """, (path, path)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to look up path {path}: {e}")
+            return None
+    
     def get_photo_by_path(self, path: str) -> Optional[sqlite3.Row]:
         """Get photo record by file path."""
         try:
@@ -358,6 +628,16 @@ class Database:
             logger.error(f"Failed to get photo by path: {e}")
             return None
     
+    def get_photo_by_hash(self, hash_value: str) -> Optional[sqlite3.Row]:
+        """Get any photo record with the given hash."""
+        try:
+            return self.conn.execute(
+                "SELECT * FROM photos WHERE hash = ? LIMIT 1", (hash_value,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to get photo by hash: {e}")
+            return None
+    
     def get_video_by_path(self, path: str) -> Optional[sqlite3.Row]:
         """Get video record by file path."""
         try:
@@ -646,21 +926,19 @@ class Database:
             
             # Get photo hashes
             rows = self.conn.execute(
-                "SELECT path, hash FROM photos WHERE hash IS NOT NULL"
+                "SELECT folder, hash FROM photos WHERE hash IS NOT NULL"
             ).fetchall()
             
             for r in rows:
-                folder = str(Path(r["path"]).parent)
-                folder_map.setdefault(folder, set()).add(r["hash"])
+                folder_map.setdefault(r["folder"], set()).add(r["hash"])
             
             # Get video hashes
             rows = self.conn.execute(
-                "SELECT path, hash FROM videos WHERE hash IS NOT NULL"
+                "SELECT folder, hash FROM videos WHERE hash IS NOT NULL"
             ).fetchall()
             
             for r in rows:
-                folder = str(Path(r["path"]).parent)
-                folder_map.setdefault(folder, set()).add(r["hash"])
+                folder_map.setdefault(r["folder"], set()).add(r["hash"])
             
             return folder_map
             
@@ -668,6 +946,87 @@ class Database:
             logger.error(f"Failed to get folder hash map: {e}")
             return {}
     
+    # ---------------------------
+    # File Signatures
+    # ---------------------------
+    
+    def lookup_file_sig(self, dev: int, ino: int, mtime_ns: int, size: int) -> Optional[str]:
+        """
+        Get the hash recorded for a file identity.
+        
+        Args:
+            dev: Device number (st_dev)
+            ino: Inode number (st_ino)
+            mtime_ns: Modification time in nanoseconds (st_mtime_ns)
+            size: File size in bytes
+            
+        Returns:
+            Hash value, or None if unknown or the file changed since
+        """
+        try:
+            row = self.conn.execute(
+                "SELECT hash FROM file_sig WHERE dev = ? AND ino = ? AND mtime_ns = ? AND size = ?",
+                (dev, ino, mtime_ns, size)
+            ).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Failed to look up file signature: {e}")
+            return None
+    
+    def insert_file_sigs_batch(self, batch: List[Tuple]) -> int:
+        """
+        Record the hashes of multiple file identities and commit them.
+        
+        A file whose identity is already recorded (e.g. it was modified
+        since) has its entry replaced.
+        
+        Args:
+            batch: List of tuples (dev, ino, mtime_ns, size, hash)
+            
+        Returns:
+            Number of records written
+        """
+        if not batch:
+            return 0
+        
+        try:
+            with self.conn:
+                cursor = self.conn.executemany("""
+                    INSERT OR REPLACE INTO file_sig(dev, ino, mtime_ns, size, hash)
+                    VALUES (?, ?, ?, ?, ?)
+                """, batch)
+            return cursor.rowcount
+            
+        except sqlite3.Error as e:
+            logger.error(f"Failed to record file signatures: {e}")
+            return 0
+    
+    # ---------------------------
+    # Metadata
+    # ---------------------------
+    
+    def get_metadata(self, key: str) -> Optional[str]:
+        """Get a value from the metadata table, or None if not set."""
+        try:
+            row = self.conn.execute(
+                "SELECT value FROM metadata WHERE key = ?", (key,)
+            ).fetchone()
+            return row["value"] if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read metadata {key}: {e}")
+            return None
+    
+    def set_metadata(self, key: str, value: str):
+        """Store a value in the metadata table (replacing any previous one)."""
+        try:
+            with self.transaction():
+                self.conn.execute("""
+                    INSERT INTO metadata(key, value) VALUES (?, ?)
+                    ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+                """, (key, value))
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to write metadata {key}: {e}") from e
+    
     # ---------------------------
     # Utility Methods
     # ---------------------------
@@ -694,6 +1053,7 @@ class Database:
             with self.transaction():
                 self.conn.execute("DELETE FROM photos")
                 self.conn.execute("DELETE FROM videos")
+                self.conn.execute("DELETE FROM file_sig")
                 self.conn.execute("DELETE FROM metadata")
                 logger.info("All data deleted from database")
         except sqlite3.Error as e:
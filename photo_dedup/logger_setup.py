@@ -10,9 +10,8 @@ def setup_logger(db_path=None, log_file=None, no_file_log=False):
     logger = logging.getLogger("photo_dedup")
     logger.setLevel(logging.DEBUG)
 
-    # Remove all existing handlers first (reset logger)
-    if logger.hasHandlers():
-        logger.handlers.clear()
+    # Replace any handlers from a previous setup
+    logger.handlers.clear()
 
     # Console handler
     console_handler = logging.StreamHandler()
@@ -33,7 +32,8 @@ def setup_logger(db_path=None, log_file=None, no_file_log=False):
         else:
             log_path = Path(f"photo_dedup_{timestamp}.log")
 
-        file_handler = logging.FileHandler(log_path, encoding="utf-8")
+        # delay=True: the log file is only created once the first record is emitted
+        file_handler = logging.FileHandler(log_path, encoding="utf-8", delay=True)
         file_formatter = logging.Formatter("[%(asctime)s] %(levelname)s: %(message)s", "%Y-%m-%d %H:%M:%S")
         file_handler.setFormatter(file_formatter)
         logger.addHandler(file_handler)
@@ -8,21 +8,24 @@ using content-based hashing.
 
 import click
 import sys
-import os
 import csv
 import logging
+import multiprocessing
+import heapq
+from operator import itemgetter
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 from scanner import FileScanner, ScanError
-from db import Database, DatabaseError
+from db import Database, DatabaseError, DB_NAME
 from utils import human_size, validate_threshold
 from logger_setup import setup_logger
 
 # Version
 __version__ = "0.2.0"
 
-# Global logger (will be configured by commands)
+# Global logger (handlers are attached by commands through setup_logging;
+# until then warnings and errors reach stderr through logging.lastResort)
 logger = logging.getLogger("photo_dedup")
 
 
@@ -63,8 +66,7 @@ def setup_logging(ctx, db_path: Optional[Path] = None, no_file_log: bool = False
         no_file_log: Disable file logging
     """
     log_file = ctx.obj.get("log_file")
-    global logger
-    logger = setup_logger(db_path=db_path, log_file=log_file, no_file_log=no_file_log)
+    setup_logger(db_path=db_path, log_file=log_file, no_file_log=no_file_log)
 
 
 def read_folder_list(file_path: str) -> List[str]:
@@ -77,14 +79,10 @@ def read_folder_list(file_path: str) -> List[str]:
     Returns:
         List of folder paths
     """
-    folders = []
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#"):  # Skip empty and comment lines
-                    folders.append(line)
-        return folders
+        lines = Path(file_path).read_text(encoding="utf-8").splitlines()
+        # Skip empty and comment lines
+        return [line for line in map(str.strip, lines) if line and not line.startswith("#")]
     except FileNotFoundError:
         logger.error(f"Folder list file not found: {file_path}")
         click.echo(f"Error: File not found: {file_path}", err=True)
@@ -95,6 +93,29 @@ def read_folder_list(file_path: str) -> List[str]:
         sys.exit(1)
 
 
+def folder_stats_rows(folder_stats: Dict[str, Dict]) -> List[Tuple]:
+    """
+    Flatten per-folder statistics into tuples sorted by folder path.
+    
+    Args:
+        folder_stats: Dictionary of folder -> statistics (see Database.get_folders_stats)
+        
+    Returns:
+        List of (folder, photos, photo_dups, photo_lost_bytes,
+        videos, video_dups, video_lost_bytes) tuples
+    """
+    rows = [
+        (
+            folder,
+            info["photos_count"], info["photos_dup_count"], info["photos_lost_bytes"],
+            info["videos_count"], info["videos_dup_count"], info["videos_lost_bytes"],
+        )
+        for folder, info in folder_stats.items()
+    ]
+    rows.sort(key=itemgetter(0))
+    return rows
+
+
 def select_master_file(files: List[Dict], keep_strategy: str) -> Dict:
     """
     Select which file to keep as master based on strategy.
@@ -184,14 +205,17 @@ def main(ctx, log_file, no_file_log):
               help="Directory for database (current directory if not specified)")
 @click.option("--folder-list", type=click.Path(exists=True),
               help="Text file with folder paths (one per line)")
-@click.option("--batch", default=200, type=click.IntRange(1, 10000),
+@click.option("--batch", default=1000, type=click.IntRange(1, 10000),
               help="Database commit batch size")
-@click.option("--threads", default=4, type=click.IntRange(1, 32),
-              help="Number of hashing threads")
+@click.option("--threads", type=click.IntRange(1, 32),
+              help="Number of file reading/hashing threads (default: 4 per CPU core, at least 16)")
 @click.option("--fresh", is_flag=True, 
               help="Delete database and perform full clean scan")
+@click.option("--processes", is_flag=True,
+              help="Process photos in worker processes, one per CPU core (uses several cores for EXIF parsing, "
+                   "but reads fewer photos at once)")
 @click.pass_context
-def scan(ctx, folders, db_path, folder_list, batch, threads, fresh):
+def scan(ctx, folders, db_path, folder_list, batch, threads, fresh, processes):
     """
     Scan folders and index photos/videos in database.
     
@@ -221,28 +245,25 @@ def scan(ctx, folders, db_path, folder_list, batch, threads, fresh):
     
     # Handle fresh scan
     if fresh:
-        if db_path:
-            db_file = Path(db_path) / "photo_dedup.db"
-        else:
-            db_file = Path.cwd() / "photo_dedup.db"
-        
-        if db_file.exists():
-            click.echo(f"\n{'='*60}")
-            click.echo("   FRESH SCAN REQUESTED — DELETING DATABASE")
-            click.echo(f"   Removing: {db_file}")
-            click.echo(f"{'='*60}\n")
-            
-            try:
-                os.remove(db_file)
-            except Exception as e:
-                click.echo(f"Error: Failed to delete database: {e}", err=True)
-                sys.exit(1)
+        db_file = Path(db_path or Path.cwd()) / DB_NAME
+
+        # Only announce the deletion when there actually was a database to remove
+        try:
+            db_file.unlink()
+            click.echo("\nFRESH SCAN REQUESTED — DATABASE DELETED")
+            click.echo(f"   Removed: {db_file}\n")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            click.echo(f"Error: Failed to delete database: {e}", err=True)
+            sys.exit(1)
     
     db = get_database(ctx, db_path)
     setup_logging(ctx, db_path=db.db_path, no_file_log=ctx.obj.get("no_file_log", False))
     
     # Create scanner
-    scanner = FileScanner(db, batch_size=batch, threads=threads, skip_existing=not fresh)
+    scanner = FileScanner(db, batch_size=batch, threads=threads, skip_existing=not fresh,
+                          use_processes=processes)
     
     # Scan all folders
     total_stats = {
@@ -405,13 +426,12 @@ def folder_summary(ctx, db_path, export):
     logger.info(f"{'Folder'.ljust(max_len)} | Photos | Photo Dups | Videos | Video Dups")
     logger.info("-" * (max_len + 50))
     
-    for folder, info in sorted(folder_stats.items()):
+    rows = folder_stats_rows(folder_stats)
+    
+    for folder, photos, photo_dups, _, videos, video_dups, _ in rows:
         logger.info(
-            f"{folder.ljust(max_len)} | "
-            f"{str(info['photos_count']).rjust(6)} | "
-            f"{str(info['photos_dup_count']).rjust(10)} | "
-            f"{str(info['videos_count']).rjust(6)} | "
-            f"{str(info['videos_dup_count']).rjust(10)}"
+            f"{folder:<{max_len}} | {photos:>6} | {photo_dups:>10} | "
+            f"{videos:>6} | {video_dups:>10}"
         )
     
     # Export to CSV
@@ -425,13 +445,13 @@ def folder_summary(ctx, db_path, export):
                 ])
                 writer.writeheader()
                 
-                for folder, info in folder_stats.items():
+                for folder, photos, photo_dups, _, videos, video_dups, _ in rows:
                     writer.writerow({
                         "folder": folder,
-                        "total_photos": info["photos_count"],
-                        "duplicate_photos": info["photos_dup_count"],
-                        "total_videos": info["videos_count"],
-                        "duplicate_videos": info["videos_dup_count"]
+                        "total_photos": photos,
+                        "duplicate_photos": photo_dups,
+                        "total_videos": videos,
+                        "duplicate_videos": video_dups
                     })
             
             logger.info(f"Folder summary exported to {export_path}")
@@ -455,8 +475,10 @@ def folder_summary(ctx, db_path, export):
 @click.option("--threshold", default=0.5, type=click.FloatRange(0.0, 1.0),
               show_default=True,
               help="Minimum similarity score (0-1) to display")
+@click.option("--top", type=click.IntRange(min=1), default=None,
+              help="Only display the K most similar folder pairs")
 @click.pass_context
-def folder_similar(ctx, db_path, export, threshold):
+def folder_similar(ctx, db_path, export, threshold, top):
     """
     Detect folders with similar content based on shared files.
     
@@ -465,6 +487,7 @@ def folder_similar(ctx, db_path, export, threshold):
     
     Example:
         photo-dedup folder-similar --threshold 0.3
+        photo-dedup folder-similar --top 20
     """
     db = get_database(ctx, db_path)
     setup_logging(ctx, db_path=db.db_path, no_file_log=ctx.obj.get("no_file_log", False))
@@ -492,19 +515,19 @@ def folder_similar(ctx, db_path, export, threshold):
     
     logger.info(f"Comparing {len(folders)} folders with threshold {threshold}")
     
-    # Compare all folder pairs
+    # Compare all folder pairs. The union size follows from the intersection
+    # (|A u B| = |A| + |B| - |A n B|), and a pair whose size ratio already caps
+    # the Jaccard score below the threshold is skipped without intersecting.
+    entries = [(f, folder_hashes[f], len(folder_hashes[f])) for f in folders if folder_hashes[f]]
     results = []
-    for i in range(len(folders)):
-        for j in range(i + 1, len(folders)):
-            f1, f2 = folders[i], folders[j]
-            s1, s2 = folder_hashes[f1], folder_hashes[f2]
-            
-            if not s1 or not s2:
+    for i, (f1, s1, n1) in enumerate(entries):
+        for f2, s2, n2 in entries[i + 1:]:
+            if min(n1, n2) / max(n1, n2) < threshold:
                 continue
             
             intersection = len(s1 & s2)
-            union = len(s1 | s2)
-            score = intersection / union if union else 0
+            union = n1 + n2 - intersection
+            score = intersection / union
             
             if score >= threshold:
                 results.append((f1, f2, score, intersection, union))
@@ -520,7 +543,13 @@ def folder_similar(ctx, db_path, export, threshold):
         
         max_len = max(len(f) for f in folders)
         
-        for f1, f2, score, inter, uni in sorted(results, key=lambda x: -x[2]):
+        # Partial selection is O(N log K) when only the top pairs are wanted
+        if top:
+            ranked = heapq.nlargest(top, results, key=itemgetter(2))
+        else:
+            ranked = sorted(results, key=itemgetter(2), reverse=True)
+        
+        for f1, f2, score, inter, uni in ranked:
             logger.info(
                 f"{f1.ljust(max_len)} <-> {f2.ljust(max_len)} | "
                 f"Similarity: {score:.3f} ({inter}/{uni} shared)"
@@ -590,8 +619,8 @@ def list_files(ctx, db_path, file_type, limit):
     click.echo(f"\n{'ID':>6} | {'Size':>12} | {'Path'}")
     click.echo("-" * 80)
     
-    for r in rows:
-        click.echo(f"{r['id']:6} | {human_size(r['size']):>12} | {r['path']}")
+    # Emit all rows with a single write rather than one echo per file
+    click.echo("\n".join(f"{r['id']:6} | {human_size(r['size']):>12} | {r['path']}" for r in rows))
     
     click.echo(f"\nTotal: {len(rows)} files")
     
@@ -651,18 +680,18 @@ def report(ctx, db_path):
         logger.info("=== Per-Folder Statistics ===")
         max_len = max(len(f) for f in folder_stats.keys())
         
-        logger.info(f"{'Folder'.ljust(max_len)} | {"Photos".rjust(6)} | {"Dups".rjust(6)} | {"Wasted".rjust(9)} | {"Videos".rjust(6)} | {"Dups".rjust(6)} | {"Wasted".rjust(9)}")
+        logger.info(
+            f"{'Folder':<{max_len}} | {'Photos':>6} | {'Dups':>6} | {'Wasted':>9} | "
+            f"{'Videos':>6} | {'Dups':>6} | {'Wasted':>9}"
+        )
         logger.info("-" * (max_len + 60))
         
-        for folder, info in sorted(folder_stats.items()):
+        for row in folder_stats_rows(folder_stats):
+            folder, photos, photo_dups, photo_lost, videos, video_dups, video_lost = row
             logger.info(
-                f"{folder.ljust(max_len)} | "
-                f"{str(info['photos_count']).rjust(6)} | "
-                f"{str(info['photos_dup_count']).rjust(6)} | "
-                f"{human_size(info['photos_lost_bytes']).rjust(8)} | "
-                f"{str(info['videos_count']).rjust(6)} | "
-                f"{str(info['videos_dup_count']).rjust(6)} | "
-                f"{human_size(info['videos_lost_bytes']).rjust(8)}"
+                f"{folder:<{max_len}} | {photos:>6} | {photo_dups:>6} | "
+                f"{human_size(photo_lost):>8} | {videos:>6} | {video_dups:>6} | "
+                f"{human_size(video_lost):>8}"
             )
     
     logger.info("")
@@ -722,4 +751,7 @@ def vacuum(ctx, db_path):
 # ==============================================================================================
 
 if __name__ == "__main__":
+    # Needed by --processes in frozen (PyInstaller) Windows builds, where
+    # worker processes are started by running the executable again
+    multiprocessing.freeze_support()
     main(obj={})
\ No newline at end of file
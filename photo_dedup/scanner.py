@@ -6,18 +6,59 @@ and batch insertion into the database.
 """
 
 import os
+import sys
 import logging
+import logging.handlers
+import multiprocessing
+import queue
+import threading
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Tuple, Dict, Any, Optional, Set
+from concurrent.futures import BrokenExecutor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List, Tuple, Dict, Any, Optional, Iterator, Callable
 from dataclasses import dataclass
-from collections import defaultdict
+from array import array
+from bisect import bisect_left
+from operator import itemgetter
 
-from hashing import file_hash
-from utils import extract_exif, is_photo, is_video
+from db import PHOTO_SIZE_HASH_PREFIX, SIZE_HASH_PREFIX, VIDEO_SIZE_HASH_PREFIX
+from hashing import HASH_ALGORITHM, get_hash_info, hash_and_exif, path_key, prefetch_file, size_and_hash
+from utils import KIND_OTHER, KIND_PHOTO, KIND_VIDEO, classify_name, extract_exif
 
 logger = logging.getLogger("photo_dedup")
 
+# Upper limit for worker threads or processes
+MAX_THREADS = 32
+
+# Destinations of worker results, named as they appear in progress messages
+_SINK_PHOTOS = "Photos"
+_SINK_VIDEOS = "Videos"
+_SINK_INDEXED_PHOTOS = "Indexed photos"
+_SINK_INDEXED_VIDEOS = "Indexed videos"
+_SINK_FILE_SIGS = "File signatures"
+_SINK_PHOTO_MTIMES = "Photo mtimes"
+_SINK_VIDEO_MTIMES = "Video mtimes"
+
+# Files up to this size are sent to the pools FILES_PER_TASK at a time
+SMALL_TASK_SIZE = 256 * 1024
+FILES_PER_TASK = 8
+
+# Photo columns filled from EXIF data
+_EXIF_COLUMNS = ("date_taken", "camera_model", "gps_lat", "gps_lon", "orientation", "width", "height")
+
+
+def default_io_threads() -> int:
+    """
+    Default number of threads for the read and hash stages.
+    
+    File reads spend most of their time waiting on the device, so several
+    threads per core are used to keep enough requests in flight for an
+    SSD's queue depth.
+    
+    Returns:
+        Thread count between 16 and MAX_THREADS
+    """
+    return min(MAX_THREADS, max(16, 4 * (os.cpu_count() or 1)))
+
 
 @dataclass
 class ScanStats:
@@ -57,6 +98,197 @@ class ScanError(Exception):
     pass
 
 
+def _iter_entries(folder: str) -> Iterator[Tuple[str, os.DirEntry]]:
+    """
+    Walk a folder tree with os.scandir and yield its non-hidden files.
+    
+    Directory entries carry their type from readdir, so no extra stat call
+    is needed to tell files from folders. Hidden files and folders (names
+    starting with '.') are skipped, symlinked folders are not followed, and
+    entries that are not regular files (or links to them) are left out.
+    
+    Args:
+        folder: Root folder to walk
+        
+    Yields:
+        Tuples of (containing_folder, DirEntry)
+    """
+    stack = [folder]
+    while stack:
+        dirpath = stack.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+                    
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield dirpath, entry
+        
+        except PermissionError:
+            # One unreadable folder should not abort the whole scan
+            logger.warning(f"Permission denied accessing folder: {dirpath}")
+        except OSError as e:
+            logger.warning(f"Cannot read folder {dirpath}: {e}")
+
+
+def _process_photo(path: str) -> Optional[Tuple[str, int, str, Dict[str, Any]]]:
+    """
+    Process a single photo file.
+    
+    Defined at module level so it can be pickled for a process pool.
+    Errors are raised to the caller, which accounts for failed files.
+    
+    Args:
+        path: Path to photo file
+        
+    Returns:
+        Tuple of (path, size, hash, exif) or None if the file disappeared
+    """
+    # Size, hash and EXIF data from a single open of the file
+    try:
+        size, hash_value, exif = hash_and_exif(path)
+    except FileNotFoundError:
+        logger.warning(f"File disappeared: {path}")
+        return None
+    
+    return path, size, hash_value, exif
+
+
+def _process_photo_unique_size(path: str) -> Optional[Tuple[str, int, str, Dict[str, Any]]]:
+    """
+    Process a photo whose size no other file shares.
+    
+    Such a photo cannot have a duplicate, so only its EXIF data is read and
+    a size placeholder is stored instead of the content hash.
+    
+    Args:
+        path: Path to photo file
+        
+    Returns:
+        Tuple of (path, size, placeholder_hash, exif) or None if the file disappeared
+    """
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            exif = extract_exif(path, fp=f)
+    except FileNotFoundError:
+        logger.warning(f"File disappeared: {path}")
+        return None
+    
+    return path, size, f"{PHOTO_SIZE_HASH_PREFIX}{size}", exif
+
+
+def _process_file(path: str) -> Optional[Tuple[str, int, str]]:
+    """
+    Hash a single file without reading any metadata.
+    
+    Used for videos, and for indexed files whose size placeholder has to be
+    replaced by a real hash.
+    
+    Args:
+        path: Path to the file
+        
+    Returns:
+        Tuple of (path, size, hash) or None if the file disappeared
+    """
+    # Size and hash from a single open of the file
+    try:
+        size, hash_value = size_and_hash(path)
+    except FileNotFoundError:
+        logger.warning(f"File disappeared: {path}")
+        return None
+    
+    return path, size, hash_value
+
+
+def _in_inode_order(files: List[Tuple[Tuple[int, int], int, str, os.stat_result, Optional[Tuple]]]) -> Iterator[Tuple[int, str, int, Tuple, Optional[Tuple]]]:
+    """
+    Yield the media files of one directory ordered by (device, inode).
+    
+    Inode order follows the on-disk layout closely enough to turn the reads
+    into a mostly forward sweep on spinning disks.
+    
+    Args:
+        files: List of ((st_dev, st_ino), kind, path, stat_result, record)
+               tuples
+        
+    Yields:
+        Tuples of (kind, path, size, signature, record), the signature being
+        (st_dev, st_ino, st_mtime_ns, st_size)
+    """
+    files.sort(key=itemgetter(0))
+    for (dev, ino), kind, path, st, record in files:
+        yield kind, path, st.st_size, (dev, ino, st.st_mtime_ns, st.st_size), record
+
+
+def _run_one(worker: Callable[[str], Optional[Tuple]], path: str) -> List[Tuple[Optional[Tuple], Optional[Exception]]]:
+    """
+    Run a worker on one file inside a pool task.
+    
+    Args:
+        worker: Module-level worker function
+        path: File path
+        
+    Returns:
+        One-element list of (result, error), as for _run_many()
+    """
+    try:
+        return [(worker(path), None)]
+    except Exception as e:
+        return [(None, e)]
+
+
+def _run_many(worker: Callable[[str], Optional[Tuple]], paths: List[str]) -> List[Tuple[Optional[Tuple], Optional[Exception]]]:
+    """
+    Run a worker on several small files inside a single pool task.
+    
+    An error in one file does not stop the others; it is returned in that
+    file's place so the caller can account for it.
+    
+    Args:
+        worker: Module-level worker function
+        paths: File paths
+        
+    Returns:
+        List of (result, error) tuples in the order of paths
+    """
+    return [outcome for path in paths for outcome in _run_one(worker, path)]
+
+
+def _init_worker_logging(log_queue: "multiprocessing.Queue", level: int):
+    """
+    Send the log records of a photo worker process to the parent process.
+    
+    Used as the process pool initializer. The worker logger only gets a
+    QueueHandler; a QueueListener in the parent passes the records on to
+    the console and log file handlers.
+    
+    Args:
+        log_queue: Queue read by the parent's QueueListener
+        level: Effective level of the parent's logger
+    """
+    worker_logger = logging.getLogger("photo_dedup")
+    worker_logger.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    worker_logger.setLevel(level)
+    worker_logger.propagate = False
+
+
+def _process_pool_context():
+    """
+    Multiprocessing context for the photo process pool.
+    
+    On Linux the forkserver start method is used so workers do not inherit
+    a forked copy of the parent (and its open database connection); other
+    platforms keep their default start method.
+    """
+    if sys.platform.startswith("linux"):
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context()
+
+
 class FileScanner:
     """
     File scanner for photo and video files.
@@ -65,315 +297,577 @@ class FileScanner:
     and batch database insertion.
     """
     
-    def __init__(self, db, batch_size: int = 200, threads: int = 4, skip_existing: bool = True):
+    def __init__(self, db, batch_size: int = 1000, threads: Optional[int] = None, skip_existing: bool = True,
+                 use_processes: bool = False):
         """
         Initialize the file scanner.
         
         Args:
             db: Database instance
             batch_size: Number of files to batch before committing to database
-            threads: Number of worker threads for hashing
+            threads: Number of worker threads for reading and hashing files
+                     (default: default_io_threads()); CPU-bound stages use
+                     at most one worker per CPU core
             skip_existing: Skip files that are already in the database
+            use_processes: Hash photos and extract EXIF in worker processes
+                           instead of threads to use several CPU cores
         """
         self.db = db
         self.batch_size = max(1, batch_size)  # Ensure positive
-        self.threads = max(1, min(threads, 32))  # Limit between 1-32
+        if threads is None:
+            threads = default_io_threads()
+        self.threads = max(1, min(threads, MAX_THREADS))  # Limit between 1-32
+        # EXIF parsing is CPU-bound: more workers than cores would only contend
+        self.cpu_workers = max(1, min(self.threads, os.cpu_count() or 1))
         self.skip_existing = skip_existing
+        self.use_processes = use_processes
         self.stats = ScanStats()
         
-        # Cache of existing file paths in database
-        self._existing_paths: Optional[Set[str]] = None
+        # Sorted 64-bit keys of the file paths in the database
+        self._existing_keys: Optional[array] = None
+    
+    def _check_hash_algorithm(self):
+        """
+        Make sure the database holds hashes from the current algorithm.
+        
+        Records HASH_ALGORITHM on the first scan. A database whose hashes
+        were computed with another algorithm cannot be extended, since new
+        hashes would never match the old ones.
+        
+        Raises:
+            ScanError: If the database uses a different hash algorithm
+        """
+        logger.debug(f"Hashing with {HASH_ALGORITHM} via {get_hash_info()['backend']}")
+        
+        stored = self.db.get_metadata("hash_algorithm")
+        if stored is None:
+            self.db.set_metadata("hash_algorithm", HASH_ALGORITHM)
+        elif stored != HASH_ALGORITHM:
+            raise ScanError(
+                f"Database hashes use {stored}, this version uses {HASH_ALGORITHM}; "
+                f"rescan with --fresh to rebuild the database"
+            )
     
     def _load_existing_paths(self):
-        """Load existing file paths from database into cache."""
-        if self._existing_paths is None:
-            self._existing_paths = set()
-            
+        """
+        Load keys of the existing file paths from database into cache.
+        
+        Only a sorted array of 64-bit path keys is kept (8 bytes per file
+        instead of a whole path string), so memory stays small however large
+        the database is. A key match is confirmed with a database lookup.
+        """
+        if self._existing_keys is None:
             try:
-                # Load photo paths
-                for row in self.db.list_all_photos():
-                    self._existing_paths.add(row["path"])
+                keys = array("Q", map(path_key, self.db.list_all_photo_paths()))
+                keys.extend(map(path_key, self.db.list_all_video_paths()))
+                self._existing_keys = array("Q", sorted(keys))
                 
-                # Load video paths
-                for row in self.db.list_all_videos():
-                    self._existing_paths.add(row["path"])
-                
-                logger.info(f"Loaded {len(self._existing_paths)} existing file paths from database")
+                logger.info(f"Loaded {len(self._existing_keys)} existing file paths from database")
             except Exception as e:
                 logger.error(f"Failed to load existing paths: {e}")
-                self._existing_paths = set()
+                self._existing_keys = array("Q")
     
     def _is_path_indexed(self, path: str) -> bool:
         """Check if a file path is already indexed in the database."""
         if not self.skip_existing:
             return False
         
-        if self._existing_paths is None:
+        if self._existing_keys is None:
             self._load_existing_paths()
         
-        return path in self._existing_paths
+        keys = self._existing_keys
+        key = path_key(path)
+        i = bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return False
+        return self.db.is_path_indexed(path)
+    
+    def _record_folder_counts(self, folder: Optional[str], photos: int, videos: int,
+                              folder_counts: Dict[str, Dict[str, int]]):
+        """
+        Record the media files found in one folder.
+        
+        Args:
+            folder: Folder path (None before the walk reaches a folder)
+            photos: Number of photos found in the folder
+            videos: Number of videos found in the folder
+            folder_counts: Dictionary with 'photos' and 'videos' count dicts
+        """
+        if photos:
+            folder_counts['photos'][folder] = photos
+            self.stats.total_photos += photos
+        if videos:
+            folder_counts['videos'][folder] = videos
+            self.stats.total_videos += videos
+        if photos or videos:
+            self.stats.folders_scanned += 1
     
-    def _collect_files(self, folder: str) -> Tuple[List[str], List[str], Dict[str, int]]:
+    def _iter_files(self, folder: str, folder_counts: Dict[str, Dict[str, int]]) -> Iterator[Tuple[int, str, int, Tuple, Optional[Tuple]]]:
         """
-        Collect photo and video files from folder recursively.
+        Walk a folder recursively and yield the media files not indexed yet.
+        
+        Files are yielded as the walk reaches them, one directory at a time,
+        so hashing starts with the first folder instead of after the whole
+        tree has been listed. Indexed files are yielded again only if their
+        size or modification time differs from the record, or if the record
+        predates stored modification times and the size still matches, so
+        the time can be filled in. File totals, skipped files and the
+        per-folder counts are updated along the way.
         
         Args:
             folder: Root folder to scan
+            folder_counts: Dictionary with 'photos' and 'videos' dicts that
+                           receive the number of files per subfolder
             
-        Returns:
-            Tuple of (photo_paths, video_paths, folder_counts)
+        Yields:
+            Tuples of (kind, path, size, signature, record) with kind
+            KIND_PHOTO or KIND_VIDEO, signature (st_dev, st_ino, st_mtime_ns,
+            st_size) and record the indexed (size, mtime_ns), or None for
+            files not indexed yet
         """
-        photo_files = []
-        video_files = []
-        folder_counts_photos = defaultdict(int)
-        folder_counts_videos = defaultdict(int)
-        
         logger.info(f"Collecting files from: {folder}")
         
+        # Bind the indexed-path keys to a local once instead of going
+        # through _is_path_indexed() for every directory entry
+        existing = None
+        if self.skip_existing:
+            self._load_existing_paths()
+            existing = self._existing_keys
+            existing_count = len(existing)
+        
+        # Media files of the directory being walked, sorted before yielding,
+        # and its counts, recorded once per directory
+        current_dir = None
+        dir_files = []
+        photos_here = 0
+        videos_here = 0
+        changed = 0
+        
         try:
-            for root, dirs, files in os.walk(folder):
-                # Skip hidden directories
-                dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for root, entry in _iter_entries(folder):
+                if root != current_dir:
+                    self._record_folder_counts(current_dir, photos_here, videos_here, folder_counts)
+                    yield from _in_inode_order(dir_files)
+                    dir_files = []
+                    photos_here = 0
+                    videos_here = 0
+                    current_dir = root
                 
-                for filename in files:
-                    # Skip hidden files
-                    if filename.startswith('.'):
-                        continue
-                    
-                    filepath = os.path.join(root, filename)
-                    
-                    # Skip if already indexed
-                    if self._is_path_indexed(filepath):
-                        self.stats.skipped_files += 1
-                        continue
-                    
+                # Classify on the extension of the bare name
+                kind = classify_name(entry.name)
+                if kind == KIND_OTHER:
+                    continue
+                
+                filepath = entry.path
+                
+                # Sizes decide which files need hashing at all
+                try:
+                    st = entry.stat()
+                except OSError as e:
+                    logger.warning(f"Cannot stat {filepath}: {e}")
+                    continue
+                
+                # Skip if already indexed and unchanged (a key match is
+                # confirmed in the database)
+                indexed = None
+                if existing is not None:
+                    key = path_key(filepath)
+                    i = bisect_left(existing, key)
+                    if i < existing_count and existing[i] == key:
+                        indexed = self.db.get_indexed_stat(filepath)
+                        if indexed is not None:
+                            size, mtime_ns = indexed
+                            if size == st.st_size and mtime_ns == st.st_mtime_ns:
+                                self.stats.skipped_files += 1
+                                continue
+                            # Records without an mtime predate it being
+                            # stored; a matching size counts as unchanged
+                            # and only the mtime is recorded
+                            if size == st.st_size and mtime_ns is None:
+                                self.stats.skipped_files += 1
+                                yield kind, filepath, st.st_size, (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size), indexed
+                                continue
+                            changed += 1
+                
+                # On Windows DirEntry.stat() leaves st_dev and st_ino zero;
+                # os.stat() fills in the real file identity, which only
+                # files about to be hashed need
+                if st.st_ino == 0:
                     try:
-                        if is_photo(filepath):
-                            photo_files.append(filepath)
-                            folder_counts_photos[root] += 1
-                        elif is_video(filepath):
-                            video_files.append(filepath)
-                            folder_counts_videos[root] += 1
-                    except Exception as e:
-                        logger.debug(f"Error checking file type for {filepath}: {e}")
+                        st = os.stat(filepath)
+                    except OSError as e:
+                        logger.warning(f"Cannot stat {filepath}: {e}")
+                        continue
+                
+                dir_files.append(((st.st_dev, st.st_ino), kind, filepath, st, indexed))
+                if kind == KIND_PHOTO:
+                    photos_here += 1
+                else:
+                    videos_here += 1
             
-            self.stats.total_photos = len(photo_files)
-            self.stats.total_videos = len(video_files)
-            self.stats.folders_scanned = len(set(list(folder_counts_photos.keys()) + list(folder_counts_videos.keys())))
+            self._record_folder_counts(current_dir, photos_here, videos_here, folder_counts)
+            yield from _in_inode_order(dir_files)
             
-            return photo_files, video_files, {
-                'photos': dict(folder_counts_photos),
-                'videos': dict(folder_counts_videos)
-            }
+            if changed:
+                logger.info(f"{changed} indexed files changed since the last scan and are indexed again")
             
-        except PermissionError as e:
-            logger.error(f"Permission denied accessing folder: {folder}")
-            raise ScanError(f"Permission denied: {folder}") from e
         except Exception as e:
             logger.error(f"Error collecting files from {folder}: {e}")
             raise ScanError(f"Failed to collect files: {e}") from e
     
-    def _process_photo(self, path: str) -> Optional[Tuple[str, int, str, Dict[str, Any]]]:
+    def _hash_task(self, kind: int, path: str, sig: Tuple) -> Tuple[str, Optional[Callable], Any, bool, Optional[Tuple]]:
         """
-        Process a single photo file.
+        Build the work item that hashes a file, unless its hash is known.
+        
+        A file whose signature (device, inode, mtime and size) was recorded
+        on an earlier scan, e.g. one that has only been moved or renamed,
+        is stored from the recorded hash without reading it. Photos copy
+        their EXIF fields from the indexed photo with that hash. Files
+        without an inode number (st_ino 0) have no usable identity and
+        are always read.
         
         Args:
-            path: Path to photo file
+            kind: KIND_PHOTO or KIND_VIDEO
+            path: Path to the file
+            sig: File signature (st_dev, st_ino, st_mtime_ns, st_size)
             
         Returns:
-            Tuple of (path, size, hash, exif) or None if failed
+            Work item tuple as yielded by _iter_tasks()
         """
-        try:
-            # Check if file still exists
-            if not os.path.exists(path):
-                logger.warning(f"File disappeared: {path}")
-                return None
-            
-            # Get file size
-            size = os.path.getsize(path)
-            
-            # Compute hash
-            hash_value = file_hash(path)
-            
-            # Extract EXIF data
-            exif = extract_exif(path)
-            
-            return path, size, hash_value, exif
-            
-        except PermissionError:
-            logger.warning(f"Permission denied: {path}")
-            self.stats.failed_files += 1
-            return None
-        except Exception as e:
-            logger.error(f"Failed to process photo {path}: {e}")
-            self.stats.failed_files += 1
-            return None
+        size = sig[3]
+        cached = self.db.lookup_file_sig(*sig) if sig[1] else None
+        
+        if kind == KIND_PHOTO:
+            if cached:
+                row = self.db.get_photo_by_hash(cached)
+                if row is not None:
+                    exif = {column: row[column] for column in _EXIF_COLUMNS}
+                    return _SINK_PHOTOS, None, (path, size, cached, exif, sig[2]), False, None
+            # EXIF parsing holds the GIL, so photos can optionally use processes
+            return _SINK_PHOTOS, _process_photo, path, self.use_processes, sig
+        
+        if cached:
+            return _SINK_VIDEOS, None, (path, size, cached, None, sig[2]), False, None
+        return _SINK_VIDEOS, _process_file, path, False, sig
     
-    def _process_video(self, path: str) -> Optional[Tuple[str, int, str]]:
+    def _iter_tasks(self, files: Iterator[Tuple[int, str, int, Tuple, Optional[Tuple]]]) -> Iterator[Tuple[str, Optional[Callable], Any, bool, Optional[Tuple]]]:
         """
-        Process a single video file.
+        Turn found files into work items, deciding which files need hashing.
+        
+        Files of different sizes can never be duplicates, so a file is only
+        hashed once another file of the same size has been found in this
+        scan or is already in the database. The first file of each size is
+        held back until that happens; files still held when the walk ends
+        have a unique size and are stored with a size placeholder (photos
+        still get their EXIF data). An indexed file holding a placeholder
+        is rehashed as soon as another file of its size shows up. Indexed
+        files whose record lacks an mtime but matches in size only get the
+        mtime stored.
         
         Args:
-            path: Path to video file
+            files: Iterator of (kind, path, size, signature, record) tuples
             
-        Returns:
-            Tuple of (path, size, hash) or None if failed
+        Yields:
+            Tuples of (sink, worker, argument, cpu_bound, signature): sink
+            names where the result is stored, a None worker means the
+            argument already is the result row, and a signature is recorded
+            with the resulting hash
         """
-        try:
-            # Check if file still exists
-            if not os.path.exists(path):
-                logger.warning(f"File disappeared: {path}")
-                return None
+        known_sizes = {KIND_PHOTO: self.db.list_photo_sizes(), KIND_VIDEO: self.db.list_video_sizes()}
+        size_only = {KIND_PHOTO: self.db.list_size_only_photos(), KIND_VIDEO: self.db.list_size_only_videos()}
+        held = {KIND_PHOTO: {}, KIND_VIDEO: {}}
+        hashed = 0
+        
+        for kind, path, size, sig, indexed in files:
+            if indexed == (size, None):
+                mtime_sink = _SINK_PHOTO_MTIMES if kind == KIND_PHOTO else _SINK_VIDEO_MTIMES
+                yield mtime_sink, None, (path, sig[2]), False, None
+                continue
             
-            # Get file size
-            size = os.path.getsize(path)
+            # A changed file must not pair up with its own stale record; a
+            # placeholder record is the only one of its size
+            if indexed is not None and size_only[kind].get(indexed[0]) == path:
+                del size_only[kind][indexed[0]]
+                known_sizes[kind].discard(indexed[0])
             
-            # Compute hash
-            hash_value = file_hash(path)
+            if size in known_sizes[kind]:
+                indexed = size_only[kind].pop(size, None)
+                if indexed is not None:
+                    rehash_sink = _SINK_INDEXED_PHOTOS if kind == KIND_PHOTO else _SINK_INDEXED_VIDEOS
+                    yield rehash_sink, _process_file, indexed, False, None
+            else:
+                first = held[kind].pop(size, None)
+                if first is None:
+                    held[kind][size] = (path, sig)
+                    continue
+                known_sizes[kind].add(size)
+                yield self._hash_task(kind, *first)
+                hashed += 1
             
-            return path, size, hash_value
-            
-        except PermissionError:
-            logger.warning(f"Permission denied: {path}")
-            self.stats.failed_files += 1
-            return None
-        except Exception as e:
-            logger.error(f"Failed to process video {path}: {e}")
-            self.stats.failed_files += 1
-            return None
+            yield self._hash_task(kind, path, sig)
+            hashed += 1
+        
+        unique = len(held[KIND_PHOTO]) + len(held[KIND_VIDEO])
+        logger.info(f"{hashed} files share their size with another file and were hashed, {unique} have a unique size")
+        
+        for path, sig in held[KIND_PHOTO].values():
+            yield _SINK_PHOTOS, _process_photo_unique_size, path, True, sig
+        
+        # Unique-size videos need no file access at all
+        for size, (path, sig) in held[KIND_VIDEO].items():
+            yield _SINK_VIDEOS, None, (path, size, f"{VIDEO_SIZE_HASH_PREFIX}{size}", None, sig[2]), False, None
     
-    def _process_photos_batch(self, photo_files: List[str]) -> int:
+    def _flush_batch(self, insert_batch: Callable[[List[Tuple]], int], batch: List[Tuple]) -> int:
         """
-        Process photo files in parallel with batched database inserts.
+        Insert a batch of results.
         
         Args:
-            photo_files: List of photo file paths
+            insert_batch: Database batch insert method (commits the batch itself)
+            batch: Result tuples to insert
             
         Returns:
-            Number of photos processed
+            Number of records inserted
         """
-        if not photo_files:
+        try:
+            return insert_batch(batch)
+        except Exception as e:
+            logger.error(f"Failed to insert batch: {e}")
             return 0
+    
+    def _writer_loop(self, write_queue: "queue.Queue", sinks: Dict[str, Tuple[Callable[[List[Tuple]], int], Optional[str]]]):
+        """
+        Drain result batches from the queue into the database.
         
-        logger.info(f"Processing {len(photo_files)} photos with {self.threads} threads...")
-        
-        batch = []
-        count = 0
+        Runs on a dedicated writer thread so that inserts and commit fsyncs
+        never stall the thread collecting hash results. Stops when a None
+        sentinel is received.
         
-        with ThreadPoolExecutor(max_workers=self.threads) as executor:
-            # Submit all tasks
-            futures = {executor.submit(self._process_photo, path): path for path in photo_files}
+        Args:
+            write_queue: Queue of (sink, batch, progress_message) items;
+                         batches without a message are written silently
+            sinks: Dictionary mapping sink -> (database batch method, name of
+                   the ScanStats counter to add to, or None for updates)
+        """
+        while True:
+            item = write_queue.get()
+            if item is None:
+                break
             
-            # Process results as they complete
-            for future in as_completed(futures):
-                result = future.result()
-                
-                if result:
-                    batch.append(result)
-                    count += 1
-                    
-                    # Insert batch when it reaches batch_size
-                    if len(batch) >= self.batch_size:
-                        try:
-                            inserted = self.db.insert_photos_batch(batch)
-                            self.db.commit()
-                            self.stats.processed_photos += inserted
-                            
-                            # Log progress
-                            progress_pct = (count / len(photo_files)) * 100
-                            logger.info(f"Photos: {count}/{len(photo_files)} ({progress_pct:.1f}%) - {inserted} inserted")
-                            
-                        except Exception as e:
-                            logger.error(f"Failed to insert photo batch: {e}")
-                        
-                        batch = []
-        
-        # Insert remaining batch
-        if batch:
-            try:
-                inserted = self.db.insert_photos_batch(batch)
-                self.db.commit()
-                self.stats.processed_photos += inserted
-                logger.info(f"Photos: {count}/{len(photo_files)} (100%) - {inserted} inserted")
-            except Exception as e:
-                logger.error(f"Failed to insert final photo batch: {e}")
-        
-        return count
+            sink, batch, progress = item
+            write_batch, counter = sinks[sink]
+            written = self._flush_batch(write_batch, batch)
+            if progress is None:
+                continue
+            if counter:
+                setattr(self.stats, counter, getattr(self.stats, counter) + written)
+                logger.info(f"{progress} - {written} inserted")
+            else:
+                logger.info(f"{progress} - {written} updated")
     
-    def _process_videos_batch(self, video_files: List[str]) -> int:
+    def _run_pipeline(self, tasks: Iterator[Tuple[str, Optional[Callable], Any, bool, Optional[Tuple]]]):
         """
-        Process video files in parallel with batched database inserts.
+        Run work items through the worker pools with batched database writes.
+        
+        Reading and hashing goes to a pool of self.threads threads, while
+        CPU-bound items (EXIF parsing) go to a pool of self.cpu_workers
+        threads, or processes with use_processes. Files up to
+        SMALL_TASK_SIZE are handled FILES_PER_TASK per pool task. Items are
+        pulled from the iterator only as results are drained, keeping at
+        most (threads + cpu_workers) * 4 tasks in flight, so the directory
+        walk runs just ahead of the workers and memory stays flat however
+        large the library is. Finished futures report themselves on a
+        queue, so each completion costs O(1) instead of a wait() over the
+        whole window, and a slow file never holds back the others. Full
+        batches are handed to a writer thread through a small bounded
+        queue, so database commits overlap with hashing.
         
         Args:
-            video_files: List of video file paths
+            tasks: Iterator of work items from _iter_tasks()
             
-        Returns:
-            Number of videos processed
+        Raises:
+            ScanError: If a worker process dies and breaks the pool
         """
-        if not video_files:
-            return 0
-        
-        logger.info(f"Processing {len(video_files)} videos with {self.threads} threads...")
-        
-        batch = []
-        count = 0
+        sinks = {
+            _SINK_PHOTOS: (self.db.insert_photos_batch, "processed_photos"),
+            _SINK_VIDEOS: (self.db.insert_videos_batch, "processed_videos"),
+            _SINK_INDEXED_PHOTOS: (self.db.update_photo_hashes, None),
+            _SINK_INDEXED_VIDEOS: (self.db.update_video_hashes, None),
+            _SINK_FILE_SIGS: (self.db.insert_file_sigs_batch, None),
+            _SINK_PHOTO_MTIMES: (self.db.update_photo_mtimes, None),
+            _SINK_VIDEO_MTIMES: (self.db.update_video_mtimes, None),
+        }
+        
+        io_executor = ThreadPoolExecutor(max_workers=self.threads)
+        log_listener = None
+        if self.use_processes:
+            # Worker processes log through a queue, as their own handlers
+            # would not reach the console or the log file
+            context = _process_pool_context()
+            log_queue = context.Queue()
+            log_listener = logging.handlers.QueueListener(log_queue, logger)
+            log_listener.start()
+            cpu_executor = ProcessPoolExecutor(
+                max_workers=self.cpu_workers, mp_context=context,
+                initializer=_init_worker_logging, initargs=(log_queue, logger.getEffectiveLevel())
+            )
+            cpu_kind = "processes"
+        else:
+            cpu_executor = ThreadPoolExecutor(max_workers=self.cpu_workers)
+            cpu_kind = "threads"
+        logger.info(f"Processing with {self.threads} I/O threads and {self.cpu_workers} CPU {cpu_kind}...")
+        
+        batches = {sink: [] for sink in sinks}
+        counts = dict.fromkeys(sinks, 0)
+        
+        write_queue = queue.Queue(maxsize=4)
+        writer = threading.Thread(
+            target=self._writer_loop, args=(write_queue, sinks),
+            name="photo_dedup-writer", daemon=True
+        )
+        writer.start()
         
-        with ThreadPoolExecutor(max_workers=self.threads) as executor:
-            # Submit all tasks
-            futures = {executor.submit(self._process_video, path): path for path in video_files}
+        def add_result(sink: str, result: Tuple):
+            batch = batches[sink]
+            batch.append(result)
+            counts[sink] += 1
             
-            # Process results as they complete
-            for future in as_completed(futures):
-                result = future.result()
+            # Hand the batch to the writer when it reaches batch_size
+            if len(batch) >= self.batch_size:
+                progress = None if sink == _SINK_FILE_SIGS else f"{sink}: {counts[sink]} processed"
+                write_queue.put((sink, batch, progress))
+                batches[sink] = []
+        
+        try:
+            with io_executor, cpu_executor:
+                inflight = {}
+                done_queue = queue.SimpleQueue()
+                
+                def start(executor, items: List[Tuple], fn: Callable, *args):
+                    future = executor.submit(fn, *args)
+                    inflight[future] = items
+                    future.add_done_callback(done_queue.put)
                 
-                if result:
-                    batch.append(result)
-                    count += 1
+                def submit(n: int):
+                    # Pull up to n work items; ready-made rows skip the pools
+                    while n > 0:
+                        task = next(tasks, None)
+                        if task is None:
+                            # Send off the partly filled groups of small files
+                            for (worker, cpu_bound), items in small_files.items():
+                                executor = cpu_executor if cpu_bound else io_executor
+                                start(executor, items, _run_many, worker, [item[1] for item in items])
+                            small_files.clear()
+                            return
+                        
+                        sink, worker, arg, cpu_bound, sig = task
+                        if worker is None:
+                            add_result(sink, arg)
+                            continue
+                        
+                        # Start the read-ahead now: the file waits in the pool
+                        # queue while the workers finish the files before it.
+                        # EXIF-only work reads just the file header.
+                        if worker is not _process_photo_unique_size:
+                            prefetch_file(arg)
+                        executor = cpu_executor if cpu_bound else io_executor
+                        
+                        # Small files are grouped so the per-task overhead
+                        # (and pickling, for processes) is paid once per group
+                        if sig is not None and sig[3] <= SMALL_TASK_SIZE:
+                            items = small_files.setdefault((worker, cpu_bound), [])
+                            items.append((sink, arg, sig))
+                            if len(items) < FILES_PER_TASK:
+                                continue
+                            del small_files[(worker, cpu_bound)]
+                            start(executor, items, _run_many, worker, [item[1] for item in items])
+                        else:
+                            start(executor, [(sink, arg, sig)], _run_one, worker, arg)
+                        n -= 1
+                
+                small_files = {}
+                submit((self.threads + self.cpu_workers) * 4)
+                
+                while inflight:
+                    future = done_queue.get()
+                    items = inflight.pop(future)
+                    
+                    # Refill the window before draining so workers stay busy
+                    submit(1)
+                    
+                    try:
+                        outcomes = future.result()
+                    except BrokenExecutor:
+                        raise
+                    except Exception as e:
+                        # The task failed as a whole (e.g. its result could
+                        # not be pickled back from a worker process)
+                        outcomes = [(None, e)] * len(items)
                     
-                    # Insert batch when it reaches batch_size
-                    if len(batch) >= self.batch_size:
-                        try:
-                            inserted = self.db.insert_videos_batch(batch)
-                            self.db.commit()
-                            self.stats.processed_videos += inserted
-                            
-                            # Log progress
-                            progress_pct = (count / len(video_files)) * 100
-                            logger.info(f"Videos: {count}/{len(video_files)} ({progress_pct:.1f}%) - {inserted} inserted")
-                            
-                        except Exception as e:
-                            logger.error(f"Failed to insert video batch: {e}")
+                    for (sink, path, sig), (result, error) in zip(items, outcomes):
+                        if isinstance(error, PermissionError):
+                            logger.warning(f"Permission denied: {path}")
+                            self.stats.failed_files += 1
+                            continue
+                        if error is not None:
+                            logger.error(f"Failed to process {path}: {error}")
+                            self.stats.failed_files += 1
+                            continue
                         
-                        batch = []
-        
-        # Insert remaining batch
-        if batch:
-            try:
-                inserted = self.db.insert_videos_batch(batch)
-                self.db.commit()
-                self.stats.processed_videos += inserted
-                logger.info(f"Videos: {count}/{len(video_files)} (100%) - {inserted} inserted")
-            except Exception as e:
-                logger.error(f"Failed to insert final video batch: {e}")
-        
-        return count
+                        if not result:
+                            continue
+                        
+                        # Record the mtime the file was found with, unless it
+                        # changed size since; it is then indexed again on the
+                        # next scan
+                        mtime_ns = sig[2] if sig is not None and result[1] == sig[3] else None
+                        if sink == _SINK_PHOTOS:
+                            result += (mtime_ns,)
+                        elif sink == _SINK_VIDEOS:
+                            result += (None, mtime_ns)
+                        add_result(sink, result)
+                        
+                        # Remember the hash for this file identity, unless
+                        # there is none or the file was not hashed
+                        if mtime_ns is not None and sig[1] and not result[2].startswith(SIZE_HASH_PREFIX):
+                            add_result(_SINK_FILE_SIGS, sig + (result[2],))
+        
+        except BrokenExecutor as e:
+            # A worker process died and took its pool down, failing every
+            # task still in it; the results gathered so far are kept
+            raise ScanError(f"Worker pool stopped unexpectedly: {e}") from e
+        
+        finally:
+            # Write remaining batches
+            for sink, batch in batches.items():
+                if batch:
+                    progress = None if sink == _SINK_FILE_SIGS else f"{sink}: {counts[sink]} processed (done)"
+                    write_queue.put((sink, batch, progress))
+            
+            # Let the writer finish the queued batches before returning
+            write_queue.put(None)
+            writer.join()
+            
+            # The pool has shut down, so every worker record is queued
+            if log_listener is not None:
+                log_listener.stop()
     
     def _log_folder_summary(self, folder_counts: Dict[str, Dict[str, int]]):
-        """Log summary of files found per subfolder."""
-        photo_counts = folder_counts.get('photos', {})
-        video_counts = folder_counts.get('videos', {})
-        
-        if photo_counts:
-            logger.info("\n=== Photos by Subfolder ===")
-            max_len = max(len(str(p)) for p in photo_counts.keys())
-            for subfolder, count in sorted(photo_counts.items()):
-                logger.info(f"  {str(subfolder).ljust(max_len)} | {str(count).rjust(5)} files")
-        
-        if video_counts:
-            logger.info("\n=== Videos by Subfolder ===")
-            max_len = max(len(str(p)) for p in video_counts.keys())
-            for subfolder, count in sorted(video_counts.items()):
-                logger.info(f"  {str(subfolder).ljust(max_len)} | {str(count).rjust(5)} files")
+        """
+        Log summary of files found per subfolder.
+        
+        Each table is formatted in one pass and logged as a single record,
+        and nothing is formatted when INFO messages are not logged.
+        """
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        
+        for title, counts in (("Photos", folder_counts.get('photos')), ("Videos", folder_counts.get('videos'))):
+            if not counts:
+                continue
+            max_len = max(map(len, counts))
+            lines = [f"\n=== {title} by Subfolder ==="]
+            lines.extend(f"  {subfolder:<{max_len}} | {count:>5} files" for subfolder, count in sorted(counts.items()))
+            logger.info("\n".join(lines))
     
     def scan(self, folder: str) -> ScanStats:
         """
@@ -396,31 +890,29 @@ class FileScanner:
         if not folder_path.is_dir():
             raise ScanError(f"Path is not a directory: {folder}")
         
+        self._check_hash_algorithm()
+        
         logger.info("")
         logger.info("=" * 60)
         logger.info(f"Starting scan: {folder_path}")
         logger.info("=" * 60)
         
-        # Collect all files
-        photo_files, video_files, folder_counts = self._collect_files(str(folder_path))
+        # Walk the folder and hash files as they are found
+        self.stats.total_photos = 0
+        self.stats.total_videos = 0
+        self.stats.folders_scanned = 0
+        folder_counts = {'photos': {}, 'videos': {}}
+        
+        logger.info("\n--- Processing Files ---")
+        self._run_pipeline(self._iter_tasks(self._iter_files(str(folder_path), folder_counts)))
         
-        logger.info(f"\nFound {len(photo_files)} photos and {len(video_files)} videos")
+        logger.info(f"\nFound {self.stats.total_photos} photos and {self.stats.total_videos} videos")
         if self.stats.skipped_files > 0:
             logger.info(f"Skipped {self.stats.skipped_files} already indexed files")
         
         # Log subfolder summary
         self._log_folder_summary(folder_counts)
         
-        # Process photos
-        if photo_files:
-            logger.info("\n--- Processing Photos ---")
-            self._process_photos_batch(photo_files)
-        
-        # Process videos
-        if video_files:
-            logger.info("\n--- Processing Videos ---")
-            self._process_videos_batch(video_files)
-        
         # Final statistics
         logger.info("")
         logger.info("=" * 60)
@@ -432,7 +924,7 @@ class FileScanner:
         return self.stats
 
 
-def scan_folder(folder: str, db, batch_size: int = 200, threads: int = 4) -> int:
+def scan_folder(folder: str, db, batch_size: int = 1000, threads: Optional[int] = None) -> int:
     """
     Legacy function for backward compatibility.
     
@@ -442,7 +934,7 @@ def scan_folder(folder: str, db, batch_size: int = 200, threads: int = 4) -> int
         folder: Root folder to scan
         db: Database instance
         batch_size: Number of files per batch commit
-        threads: Number of hashing threads
+        threads: Number of hashing threads (default: default_io_threads())
         
     Returns:
         Total number of files processed
@@ -452,7 +944,8 @@ def scan_folder(folder: str, db, batch_size: int = 200, threads: int = 4) -> int
     return stats.total_processed
 
 
-def scan_multiple_folders(folders: List[str], db, batch_size: int = 200, threads: int = 4) -> Dict[str, ScanStats]:
+def scan_multiple_folders(folders: List[str], db, batch_size: int = 1000,
+                          threads: Optional[int] = None) -> Dict[str, ScanStats]:
     """
     Scan multiple folders sequentially.
     
@@ -460,7 +953,7 @@ def scan_multiple_folders(folders: List[str], db, batch_size: int = 200, threads
         folders: List of folder paths to scan
         db: Database instance
         batch_size: Number of files per batch commit
-        threads: Number of hashing threads
+        threads: Number of hashing threads (default: default_io_threads())
         
     Returns:
         Dictionary mapping folder path -> ScanStats
@@ -481,7 +974,6 @@ def scan_multiple_folders(folders: List[str], db, batch_size: int = 200, threads
 
 if __name__ == "__main__":
     # Example usage
-    import sys
     from db import Database
     
     logging.basicConfig(
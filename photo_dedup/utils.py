@@ -8,10 +8,10 @@ This module provides helper functions for:
 """
 
 import logging
+import os
 from pathlib import Path
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, BinaryIO
 from PIL import Image
-from PIL.ExifTags import TAGS, GPSTAGS
 
 logger = logging.getLogger("photo_dedup")
 
@@ -27,6 +27,37 @@ VIDEO_EXTENSIONS = frozenset({
     ".wmv", ".m4v", ".mpg", ".mpeg", ".3gp", ".ogv"
 })
 
+# File kinds returned by classify_name()
+KIND_OTHER = 0
+KIND_PHOTO = 1
+KIND_VIDEO = 2
+
+_EXT_KIND = {ext: KIND_PHOTO for ext in PHOTO_EXTENSIONS}
+_EXT_KIND.update({ext: KIND_VIDEO for ext in VIDEO_EXTENSIONS})
+
+# EXIF tag IDs read by extract_exif()
+_TAG_MODEL = 0x0110
+_TAG_ORIENTATION = 0x0112
+_TAG_DATETIME = 0x0132
+_TAG_EXIF_IFD = 0x8769
+_TAG_GPS_IFD = 0x8825
+_TAG_DATETIME_ORIGINAL = 0x9003
+_TAG_DATETIME_DIGITIZED = 0x9004
+
+# Tag IDs inside the GPS IFD
+_TAG_GPS_LATITUDE_REF = 1
+_TAG_GPS_LATITUDE = 2
+_TAG_GPS_LONGITUDE_REF = 3
+_TAG_GPS_LONGITUDE = 4
+
+# PIL formats tried when opening a photo for its EXIF data; raw camera
+# files (CR2, NEF, ARW, DNG) are TIFF containers. HEIF is only available
+# when a plugin such as pillow-heif has registered it.
+_EXIF_FORMATS = ("JPEG", "TIFF", "PNG", "WEBP", "HEIF", "GIF", "BMP")
+
+# Registered subset of _EXIF_FORMATS, filled on first use
+_open_formats: Optional[tuple] = None
+
 
 def human_size(num_bytes: int) -> str:
     """
@@ -55,6 +86,26 @@ def human_size(num_bytes: int) -> str:
     return f"{num_bytes:6.1f} EB"
 
 
+def classify_name(name: str) -> int:
+    """
+    Classify a bare file name by its extension.
+    
+    Works on the name alone (e.g. os.DirEntry.name) without building a
+    Path, so it is cheap enough to call for every directory entry.
+    
+    Args:
+        name: File name without any directory part
+        
+    Returns:
+        KIND_PHOTO, KIND_VIDEO or KIND_OTHER
+    """
+    i = name.rfind('.')
+    # Like Path.suffix, a leading dot alone does not start an extension
+    if i <= 0:
+        return KIND_OTHER
+    return _EXT_KIND.get(name[i:].lower(), KIND_OTHER)
+
+
 def is_photo(file_path: str | Path) -> bool:
     """
     Check if file is a supported photo format.
@@ -65,7 +116,7 @@ def is_photo(file_path: str | Path) -> bool:
     Returns:
         True if file extension matches photo formats
     """
-    return Path(file_path).suffix.lower() in PHOTO_EXTENSIONS
+    return classify_name(os.path.basename(file_path)) == KIND_PHOTO
 
 
 def is_video(file_path: str | Path) -> bool:
@@ -78,7 +129,7 @@ def is_video(file_path: str | Path) -> bool:
     Returns:
         True if file extension matches video formats
     """
-    return Path(file_path).suffix.lower() in VIDEO_EXTENSIONS
+    return classify_name(os.path.basename(file_path)) == KIND_VIDEO
 
 
 def is_media_file(file_path: str | Path) -> bool:
@@ -91,65 +142,86 @@ def is_media_file(file_path: str | Path) -> bool:
     Returns:
         True if file is a supported media format
     """
-    return is_photo(file_path) or is_video(file_path)
+    return classify_name(os.path.basename(file_path)) != KIND_OTHER
 
 
-def _convert_gps_coordinate(coord_tuple: tuple) -> float:
+def _convert_gps_coordinate(coord_tuple: tuple) -> Optional[float]:
     """
     Convert GPS coordinate from degrees/minutes/seconds to decimal.
     
     Args:
-        coord_tuple: Tuple of (degrees, minutes, seconds) where each
-                     is a ratio (numerator, denominator)
+        coord_tuple: Tuple of (degrees, minutes, seconds) where each is a
+                     number, such as the IFDRational values PIL returns
                      
     Returns:
-        Decimal coordinate value
+        Decimal coordinate value, or None if a component is malformed or
+        has a zero denominator
         
     Examples:
-        >>> _convert_gps_coordinate(((40, 1), (26, 1), (46, 1)))
+        >>> _convert_gps_coordinate((40, 26, 46))
         40.44611111111111
     """
     try:
-        degrees, minutes, seconds = coord_tuple
-        d = degrees[0] / degrees[1] if degrees[1] != 0 else 0
-        m = minutes[0] / minutes[1] if minutes[1] != 0 else 0
-        s = seconds[0] / seconds[1] if seconds[1] != 0 else 0
-        return d + m / 60.0 + s / 3600.0
-    except (TypeError, ZeroDivisionError, IndexError) as e:
+        # An IFDRational with a zero denominator converts to NaN, not an error
+        if any(getattr(value, 'denominator', 1) == 0 for value in coord_tuple[:3]):
+            return None
+        return float(coord_tuple[0]) + float(coord_tuple[1]) / 60.0 + float(coord_tuple[2]) / 3600.0
+    except (TypeError, ValueError, ZeroDivisionError, IndexError) as e:
         logger.debug(f"Error converting GPS coordinate: {e}")
-        return 0.0
+        return None
 
 
-def _extract_gps_info(exif_data: Dict[str, Any]) -> tuple[Optional[float], Optional[float]]:
+def _image_formats() -> tuple:
+    """
+    Get the PIL formats extract_exif() lets Image.open() try.
+    
+    Image.open() raises on format names without a registered plugin, so
+    the allowlist is narrowed to the registered ones once per process.
+    
+    Returns:
+        Tuple of PIL format names
+    """
+    global _open_formats
+    if _open_formats is None:
+        Image.init()
+        _open_formats = tuple(f for f in _EXIF_FORMATS if f in Image.OPEN)
+    return _open_formats
+
+
+def _extract_gps_info(exif_data: Image.Exif) -> tuple[Optional[float], Optional[float]]:
     """
     Extract GPS latitude and longitude from EXIF data.
     
     Args:
-        exif_data: Dictionary of EXIF tags and values
+        exif_data: EXIF data as returned by Image.getexif()
         
     Returns:
         Tuple of (latitude, longitude) or (None, None) if not available
     """
-    gps_info = exif_data.get("GPSInfo")
+    # The GPS tags live in their own IFD; IFD0 only holds its offset
+    if _TAG_GPS_IFD not in exif_data:
+        return None, None
+    gps_info = exif_data.get_ifd(_TAG_GPS_IFD)
     if not gps_info:
         return None, None
     
     try:
-        # Convert GPS tags to readable names
-        gps_data = {GPSTAGS.get(k, k): v for k, v in gps_info.items()}
-        
         # Check if we have the required fields
-        if 'GPSLatitude' not in gps_data or 'GPSLongitude' not in gps_data:
+        if _TAG_GPS_LATITUDE not in gps_info or _TAG_GPS_LONGITUDE not in gps_info:
             return None, None
         
         # Extract and convert latitude
-        lat = _convert_gps_coordinate(gps_data['GPSLatitude'])
-        if gps_data.get('GPSLatitudeRef', 'N') == 'S':
+        lat = _convert_gps_coordinate(gps_info[_TAG_GPS_LATITUDE])
+        if lat is None:
+            return None, None
+        if gps_info.get(_TAG_GPS_LATITUDE_REF, 'N') == 'S':
             lat = -lat
         
         # Extract and convert longitude
-        lon = _convert_gps_coordinate(gps_data['GPSLongitude'])
-        if gps_data.get('GPSLongitudeRef', 'E') == 'W':
+        lon = _convert_gps_coordinate(gps_info[_TAG_GPS_LONGITUDE])
+        if lon is None:
+            return None, None
+        if gps_info.get(_TAG_GPS_LONGITUDE_REF, 'E') == 'W':
             lon = -lon
         
         return lat, lon
@@ -159,12 +231,14 @@ def _extract_gps_info(exif_data: Dict[str, Any]) -> tuple[Optional[float], Optio
         return None, None
 
 
-def extract_exif(file_path: str | Path) -> Dict[str, Any]:
+def extract_exif(file_path: str | Path, fp: Optional[BinaryIO] = None) -> Dict[str, Any]:
     """
     Extract key EXIF metadata from an image file.
     
     Args:
         file_path: Path to image file
+        fp: Optional binary file object already open on file_path, positioned
+            at the start; PIL reads from it instead of opening the file again
         
     Returns:
         Dictionary containing:
@@ -194,37 +268,37 @@ def extract_exif(file_path: str | Path) -> Dict[str, Any]:
     }
     
     try:
-        with Image.open(file_path) as img:
+        # Only photo formats are probed, instead of every registered plugin.
+        # Opening parses the headers alone; pixel data is never decoded.
+        with Image.open(fp if fp is not None else file_path, formats=_image_formats()) as img:
             # Get image dimensions
             result["width"], result["height"] = img.size
             
-            # Get EXIF data
+            # Get EXIF data. Tags are looked up by ID so PIL only decodes
+            # the values we keep, not every entry in the directory.
             exif_data = img.getexif()
             if not exif_data:
                 logger.debug(f"No EXIF data found in {file_path}")
                 return result
             
-            # Convert numeric tags to readable names
-            exif_dict = {}
-            for tag_id, value in exif_data.items():
-                tag_name = TAGS.get(tag_id, tag_id)
-                exif_dict[tag_name] = value
+            # The capture dates live in the Exif sub-IFD, not in IFD0
+            exif_ifd = exif_data.get_ifd(_TAG_EXIF_IFD) if _TAG_EXIF_IFD in exif_data else {}
             
             # Extract date taken (try multiple fields)
             result["date_taken"] = (
-                exif_dict.get("DateTimeOriginal") or
-                exif_dict.get("DateTime") or
-                exif_dict.get("DateTimeDigitized")
+                exif_ifd.get(_TAG_DATETIME_ORIGINAL) or
+                exif_data.get(_TAG_DATETIME) or
+                exif_ifd.get(_TAG_DATETIME_DIGITIZED)
             )
             
             # Extract camera model
-            result["camera_model"] = exif_dict.get("Model")
+            result["camera_model"] = exif_data.get(_TAG_MODEL)
             
             # Extract orientation
-            result["orientation"] = exif_dict.get("Orientation")
+            result["orientation"] = exif_data.get(_TAG_ORIENTATION)
             
             # Extract GPS coordinates
-            lat, lon = _extract_gps_info(exif_dict)
+            lat, lon = _extract_gps_info(exif_data)
             result["gps_lat"] = lat
             result["gps_lon"] = lon
             
@@ -314,9 +388,10 @@ def get_file_type_display(file_path: str | Path) -> str:
     Returns:
         "Photo", "Video", or "Unknown"
     """
-    if is_photo(file_path):
+    kind = classify_name(os.path.basename(file_path))
+    if kind == KIND_PHOTO:
         return "Photo"
-    elif is_video(file_path):
+    elif kind == KIND_VIDEO:
         return "Video"
     else:
         return "Unknown"
@@ -342,5 +417,5 @@ if __name__ == "__main__":
         print(f"{file:20} -> Photo: {is_photo(file)}, Video: {is_video(file)}, Type: {get_file_type_display(file)}")
     
     print("\n=== GPS Coordinate Conversion ===")
-    test_coord = ((40, 1), (26, 1), (46, 1))
+    test_coord = (40, 26, 46)
     print(f"DMS {test_coord} = {_convert_gps_coordinate(test_coord):.6f} decimal")
\ No newline at end of file